@@ -1,6 +1,64 @@
+import hashlib
 import re
+import threading
+from collections import OrderedDict
 from typing import Tuple
 
+try:
+    import ahocorasick
+except ImportError:  # Optional: fall back to the pure-Python _KeywordTrie
+    ahocorasick = None
+
+# Placeholder extraction patterns, compiled once at import time
+_NAME_RES = tuple(
+    re.compile(p, re.IGNORECASE) for p in (
+        r"my name is ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
+        r"i'?m ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
+        r"this is ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
+    )
+)
+_ORDER_RES = tuple(
+    re.compile(p, re.IGNORECASE) for p in (
+        r"order[#:\s]+([A-Z0-9-]+)",
+        r"#([0-9]{4,})",
+        r"order\s+number[#:\s]+([A-Z0-9-]+)",
+    )
+)
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+class _KeywordTrie:
+    """
+    Pure-Python stand-in for ahocorasick.Automaton, used when pyahocorasick
+    is not installed. Implements only the subset EmailClassifier needs.
+    """
+
+    def __init__(self):
+        self._root = {}
+
+    def add_word(self, word: str, value) -> None:
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[None] = value  # None marks the end of a keyword
+
+    def make_automaton(self) -> None:
+        pass
+
+    def iter(self, text: str):
+        """Yield (end_index, value) for every keyword occurrence in text."""
+        root = self._root
+        text_length = len(text)
+        for start in range(text_length):
+            node = root.get(text[start])
+            index = start
+            while node is not None:
+                if None in node:
+                    yield index, node[None]
+                index += 1
+                if index == text_length:
+                    break
+                node = node.get(text[index])
+
 class EmailClassifier:
     """
     Classifies email intent with confidence score.
@@ -9,30 +67,65 @@ class EmailClassifier:
     """
 
     INTENT_KEYWORDS = {
-        "billing": [
+        "billing": (
             "invoice", "payment", "charge", "bill", "refund", "subscription",
             "credit card", "account balance", "receipt", "pricing", "cost",
             "pay", "paid", "overcharge", "unauthorized charge"
-        ],
-        "support": [
+        ),
+        "support": (
             "help", "assistance", "how to", "can't", "cannot", "unable",
             "issue", "problem", "question", "confused", "don't understand",
             "need help", "support", "guide", "tutorial", "explain"
-        ],
-        "bug": [
+        ),
+        "bug": (
             "error", "crash", "broken", "not working", "bug", "glitch",
             "fail", "failure", "incorrect", "wrong", "doesn't work",
             "stopped working", "exception", "malfunction", "defect"
-        ],
-        "feature": [
+        ),
+        "feature": (
             "feature request", "enhancement", "suggestion", "would like",
             "wish", "could you add", "implement", "new feature", "improve",
             "add support for", "integration", "capability", "functionality"
-        ]
+        )
     }
 
     LOW_CONFIDENCE_THRESHOLD = 0.4
 
+    # Number of (subject, content) decisions kept in the classification cache
+    CLASSIFY_CACHE_SIZE = 4096
+
+    NAME_PATTERNS = _NAME_RES
+    ORDER_PATTERNS = _ORDER_RES
+    EMAIL_PATTERN = _EMAIL_RE
+
+    def __init__(self):
+        # Keywords are lowercased and deduplicated once here, since classify()
+        # matches against lowercased text
+        keywords_by_intent = {
+            intent: tuple(dict.fromkeys(keyword.lower() for keyword in keywords))
+            for intent, keywords in self.INTENT_KEYWORDS.items()
+        }
+
+        # Single automaton over every keyword, so classify() scans the text once
+        intents_by_keyword = {}
+        for intent, keywords in keywords_by_intent.items():
+            for keyword in keywords:
+                intents_by_keyword.setdefault(keyword, []).append(intent)
+
+        self._automaton = ahocorasick.Automaton() if ahocorasick else _KeywordTrie()
+        for keyword, intents in intents_by_keyword.items():
+            self._automaton.add_word(keyword, (keyword, tuple(intents)))
+        self._automaton.make_automaton()
+
+        # Per-intent score normalizers, fixed by the keyword lists
+        self._normalizers = {
+            intent: len(keywords) * 0.5 for intent, keywords in keywords_by_intent.items()
+        }
+
+        # LRU of BLAKE2b(subject, content) digest -> classification result
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
     def classify(self, subject: str, content: str) -> Tuple[str, float, bool]:
         """
         Classify email intent and return (intent, confidence, needs_review).
@@ -44,26 +137,56 @@ class EmailClassifier:
         Returns:
             Tuple of (intent, confidence_score, needs_review)
         """
-        text = f"{subject} {content}".lower()
-
-        scores = {}
-        for intent, keywords in self.INTENT_KEYWORDS.items():
-            score = 0
-            matches = 0
-            for keyword in keywords:
-                if keyword in text:
-                    matches += 1
-                    # Weight matches in subject higher
-                    if keyword in subject.lower():
-                        score += 2
-                    else:
-                        score += 1
-
-            # Normalize score
-            if matches > 0:
-                scores[intent] = min(score / (len(keywords) * 0.5), 1.0)
-            else:
-                scores[intent] = 0.0
+        # Identical emails (re-imports, explicit re-classify) reuse the cached decision
+        key = self._cache_key(subject, content)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self._classify_uncached(subject, content)
+
+        with self._cache_lock:
+            self._cache[key] = result
+            if len(self._cache) > self.CLASSIFY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _cache_key(subject: str, content: str) -> bytes:
+        """BLAKE2b digest of an email; the subject is length-prefixed so field boundaries can't shift."""
+        subject_bytes = subject.encode("utf-8", "surrogatepass")
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(len(subject_bytes).to_bytes(8, "little"))
+        digest.update(subject_bytes)
+        digest.update(content.encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def _classify_uncached(self, subject: str, content: str) -> Tuple[str, float, bool]:
+        """Score every intent for an email without consulting the cache."""
+        subject_lower = subject.lower()
+        text = f"{subject_lower} {content.lower()}"
+        subject_end = len(subject_lower)
+
+        # keyword -> (intents, whether any occurrence lies entirely in the subject)
+        hits = {}
+        for end_index, (keyword, intents) in self._automaton.iter(text):
+            in_subject = end_index < subject_end
+            if keyword in hits:
+                in_subject = in_subject or hits[keyword][1]
+            hits[keyword] = (intents, in_subject)
+
+        score = dict.fromkeys(self.INTENT_KEYWORDS, 0)
+        for intents, in_subject in hits.values():
+            for intent in intents:
+                # Weight matches in subject higher
+                score[intent] += 2 if in_subject else 1
+
+        # Normalize score
+        scores = {
+            intent: min(score[intent] / normalizer, 1.0)
+            for intent, normalizer in self._normalizers.items()
+        }
 
         # Get highest scoring intent
         if not scores or max(scores.values()) == 0:
@@ -86,32 +209,21 @@ class EmailClassifier:
         info = {}
 
         # Extract name (simple pattern: looks for "My name is X" or "I'm X")
-        name_patterns = [
-            r"my name is ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
-            r"i'?m ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
-            r"this is ([A-Z][a-z]+(?: [A-Z][a-z]+)*)",
-        ]
-        for pattern in name_patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
+        for pattern in self.NAME_PATTERNS:
+            match = pattern.search(content)
             if match:
                 info['name'] = match.group(1)
                 break
 
         # Extract order ID (patterns like: #12345, order 12345, ORDER-12345)
-        order_patterns = [
-            r"order[#:\s]+([A-Z0-9-]+)",
-            r"#([0-9]{4,})",
-            r"order\s+number[#:\s]+([A-Z0-9-]+)",
-        ]
-        for pattern in order_patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
+        for pattern in self.ORDER_PATTERNS:
+            match = pattern.search(content)
             if match:
                 info['order_id'] = match.group(1)
                 break
 
         # Extract email address (if different from sender)
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        email_match = re.search(email_pattern, content)
+        email_match = self.EMAIL_PATTERN.search(content)
         if email_match:
             info['email'] = email_match.group(0)
 
@@ -1,18 +1,26 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import Optional, List
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import desc, inspect
+from pydantic import BaseModel
+from typing import Iterable, Optional, List
 from . import models, schemas
 from .classifier import EmailClassifier
 from .draft_generator import DraftGenerator
 import csv
 import io
-from datetime import datetime
 
 classifier = EmailClassifier()
 draft_gen = DraftGenerator()
 
-def create_email(db: Session, email: schemas.EmailCreate, auto_classify: bool = True) -> models.Email:
-    """Create a new email with optional auto-classification."""
+# Number of CSV rows inserted per transaction during import
+IMPORT_BATCH_SIZE = 500
+
+def _fields_set(update: BaseModel) -> dict:
+    """Fields explicitly set on a partial-update schema, in declaration order."""
+    fields_set = update.model_fields_set
+    return {name: getattr(update, name) for name in type(update).model_fields if name in fields_set}
+
+def _build_email(email: schemas.EmailCreate, auto_classify: bool = True) -> models.Email:
+    """Build an (unsaved) email with a fresh case number and optional classification."""
     case_number = draft_gen.generate_case_number()
 
     db_email = models.Email(
@@ -26,17 +34,50 @@ def create_email(db: Session, email: schemas.EmailCreate, auto_classify: bool =
         intent, confidence, needs_review = classifier.classify(email.subject, email.content)
         db_email.intent = intent
         db_email.confidence = confidence
-        db_email.folder = intent  # Folder corresponds to intent
         db_email.needs_review = needs_review
 
+    return db_email
+
+def create_email(db: Session, email: schemas.EmailCreate, auto_classify: bool = True) -> models.Email:
+    """Create a new email with optional auto-classification."""
+    db_email = _build_email(email, auto_classify)
+
     db.add(db_email)
     db.commit()
     db.refresh(db_email)
     return db_email
 
+def _reload_emails(db: Session, db_emails: List[models.Email]) -> None:
+    """Reload committed emails with one IN query per IMPORT_BATCH_SIZE rows instead of a refresh per email."""
+    # The identity key is available without loading, even on expired instances
+    email_ids = [inspect(db_email).identity[0] for db_email in db_emails]
+    for start in range(0, len(email_ids), IMPORT_BATCH_SIZE):
+        chunk = email_ids[start:start + IMPORT_BATCH_SIZE]
+        db.query(models.Email).filter(models.Email.id.in_(chunk)).all()
+
+def create_emails_bulk(db: Session, emails: Iterable[schemas.EmailCreate], auto_classify: bool = True, reload: bool = True) -> List[models.Email]:
+    """
+    Create many emails in a single transaction with optional auto-classification.
+    With reload=False the returned emails are left expired for the caller to reload.
+    """
+    db_emails = [_build_email(email, auto_classify) for email in emails]
+    if not db_emails:
+        return []
+
+    db.add_all(db_emails)
+    db.commit()
+
+    if reload:
+        _reload_emails(db, db_emails)
+    return db_emails
+
 def get_email(db: Session, email_id: int) -> Optional[models.Email]:
     """Get email by ID."""
-    return db.query(models.Email).filter(models.Email.id == email_id).first()
+    return db.get(models.Email, email_id)
+
+def get_email_with_drafts(db: Session, email_id: int) -> Optional[models.Email]:
+    """Get email by ID with its drafts loaded in the same query."""
+    return db.get(models.Email, email_id, options=[joinedload(models.Email.drafts)])
 
 def get_email_by_case(db: Session, case_number: str) -> Optional[models.Email]:
     """Get email by case number."""
@@ -46,8 +87,8 @@ def get_emails(db: Session, skip: int = 0, limit: int = 100, folder: Optional[st
     """Get list of emails with optional folder filter."""
     query = db.query(models.Email)
     if folder:
-        query = query.filter(models.Email.folder == folder)
-    return query.order_by(desc(models.Email.created_at)).offset(skip).limit(limit).all()
+        query = query.filter(models.Email.intent == folder)  # Folder corresponds to intent
+    return query.order_by(desc(models.Email.created_at), desc(models.Email.id)).offset(skip).limit(limit).all()
 
 def update_email(db: Session, email_id: int, email_update: schemas.EmailUpdate) -> Optional[models.Email]:
     """Update email."""
@@ -55,11 +96,14 @@ def update_email(db: Session, email_id: int, email_update: schemas.EmailUpdate)
     if not db_email:
         return None
 
-    update_data = email_update.model_dump(exclude_unset=True)
+    update_data = _fields_set(email_update)
+    # Folder is an alias of intent; a null folder leaves the classification alone
+    folder = update_data.pop("folder", None)
+    if folder is not None:
+        update_data.setdefault("intent", folder)
     for key, value in update_data.items():
         setattr(db_email, key, value)
 
-    db_email.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_email)
     return db_email
@@ -83,9 +127,7 @@ def classify_email(db: Session, email_id: int) -> Optional[models.Email]:
     intent, confidence, needs_review = classifier.classify(db_email.subject, db_email.content)
     db_email.intent = intent
     db_email.confidence = confidence
-    db_email.folder = intent
     db_email.needs_review = needs_review
-    db_email.updated_at = datetime.utcnow()
 
     db.commit()
     db.refresh(db_email)
@@ -135,7 +177,7 @@ def create_draft(db: Session, draft: schemas.DraftCreate) -> Optional[models.Dra
 
 def get_draft(db: Session, draft_id: int) -> Optional[models.Draft]:
     """Get draft by ID."""
-    return db.query(models.Draft).filter(models.Draft.id == draft_id).first()
+    return db.get(models.Draft, draft_id)
 
 def update_draft(db: Session, draft_id: int, draft_update: schemas.DraftUpdate) -> Optional[models.Draft]:
     """Update draft."""
@@ -143,11 +185,10 @@ def update_draft(db: Session, draft_id: int, draft_update: schemas.DraftUpdate)
     if not db_draft:
         return None
 
-    update_data = draft_update.model_dump(exclude_unset=True)
+    update_data = _fields_set(draft_update)
     for key, value in update_data.items():
         setattr(db_draft, key, value)
 
-    db_draft.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_draft)
     return db_draft
@@ -176,7 +217,7 @@ def get_templates(db: Session) -> List[models.Template]:
 
 def get_template(db: Session, template_id: int) -> Optional[models.Template]:
     """Get template by ID."""
-    return db.query(models.Template).filter(models.Template.id == template_id).first()
+    return db.get(models.Template, template_id)
 
 def update_template(db: Session, template_id: int, template_update: schemas.TemplateUpdate) -> Optional[models.Template]:
     """Update template."""
@@ -184,11 +225,10 @@ def update_template(db: Session, template_id: int, template_update: schemas.Temp
     if not db_template:
         return None
 
-    update_data = template_update.model_dump(exclude_unset=True)
+    update_data = _fields_set(template_update)
     for key, value in update_data.items():
         setattr(db_template, key, value)
 
-    db_template.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_template)
     return db_template
@@ -203,9 +243,22 @@ def delete_template(db: Session, template_id: int) -> bool:
     db.commit()
     return True
 
-def import_emails_from_csv(db: Session, csv_content: str) -> dict:
+def _import_batch(db: Session, emails: List[schemas.EmailCreate], result: dict) -> None:
+    """Insert one batch of validated CSV rows and record the outcome in result."""
+    try:
+        # Each commit expires the earlier batches too, so reloading happens once at the end
+        db_emails = create_emails_bulk(db, emails, auto_classify=True, reload=False)
+        result["success"] += len(db_emails)
+        result["imported_emails"].extend(db_emails)
+    except Exception as e:
+        db.rollback()
+        result["errors"].append(f"Database error: {str(e)}")
+        result["failed"] += len(emails)
+
+def import_emails_from_stream(db: Session, csv_lines: Iterable[str]) -> dict:
     """
-    Import emails from CSV content.
+    Import emails from an iterable of CSV lines (e.g. a text file object).
+    Rows are read lazily and inserted in batches of IMPORT_BATCH_SIZE.
     Expected format: sender,subject,content
     Returns: dict with success/failure counts and errors
     """
@@ -216,43 +269,71 @@ def import_emails_from_csv(db: Session, csv_content: str) -> dict:
         "imported_emails": []
     }
 
+    batch = []
     try:
-        csv_file = io.StringIO(csv_content)
-        reader = csv.DictReader(csv_file)
+        reader = csv.reader(csv_lines)
 
         required_fields = ["sender", "subject", "content"]
 
-        # Validate headers
-        if not all(field in reader.fieldnames for field in required_fields):
+        # Validate headers once and resolve the column positions
+        headers = next(reader, None) or []
+        column_index = {header: i for i, header in enumerate(headers)}
+        if not all(field in column_index for field in required_fields):
             result["errors"].append(f"CSV must contain columns: {', '.join(required_fields)}")
             result["failed"] += 1
             return result
 
+        sender_i, subject_i, content_i = (column_index[field] for field in required_fields)
+        min_length = max(sender_i, subject_i, content_i) + 1
+
         for row_num, row in enumerate(reader, start=2):  # Start at 2 (1 is header)
+            if not row:
+                continue  # Blank line
+
             try:
                 # Validate row data
-                if not all(row.get(field, "").strip() for field in required_fields):
+                if len(row) < min_length:
+                    sender = subject = content = ""
+                else:
+                    sender = row[sender_i].strip()
+                    subject = row[subject_i].strip()
+                    content = row[content_i].strip()
+
+                if not (sender and subject and content):
                     result["errors"].append(f"Row {row_num}: Missing required fields")
                     result["failed"] += 1
                     continue
 
-                # Create email
-                email_data = schemas.EmailCreate(
-                    sender=row["sender"].strip(),
-                    subject=row["subject"].strip(),
-                    content=row["content"].strip()
-                )
-
-                db_email = create_email(db, email_data, auto_classify=True)
-                result["success"] += 1
-                result["imported_emails"].append(db_email)
+                batch.append(schemas.EmailCreate(
+                    sender=sender,
+                    subject=subject,
+                    content=content
+                ))
 
             except Exception as e:
                 result["errors"].append(f"Row {row_num}: {str(e)}")
                 result["failed"] += 1
+                continue
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _import_batch(db, batch, result)
+                batch = []
 
     except Exception as e:
         result["errors"].append(f"CSV parsing error: {str(e)}")
         result["failed"] += 1
 
+    # Rows read before a decoding or parsing error are still imported
+    if batch:
+        _import_batch(db, batch, result)
+
+    _reload_emails(db, result["imported_emails"])
     return result
+
+def import_emails_from_csv(db: Session, csv_content: str) -> dict:
+    """
+    Import emails from CSV content.
+    Expected format: sender,subject,content
+    Returns: dict with success/failure counts and errors
+    """
+    return import_emails_from_stream(db, io.StringIO(csv_content))
@@ -1,5 +1,30 @@
-from typing import Optional
-import uuid
+from string import Formatter
+from typing import Callable, Optional
+import os
+
+def _compile_template(template: str) -> Callable[[dict], str]:
+    """
+    Pre-parse a str.format template into a function of the placeholders dict.
+
+    Only plain named fields are pre-parsed; templates using format specs,
+    conversions or positional fields fall back to str.format_map.
+    """
+    segments = []
+    for literal, field_name, format_spec, conversion in Formatter().parse(template):
+        if literal:
+            segments.append((literal, None))
+        if field_name is not None:
+            if format_spec or conversion or not field_name.isidentifier():
+                return template.format_map
+            segments.append((None, field_name))
+
+    def render(placeholders: dict) -> str:
+        return "".join(
+            literal if field_name is None else str(placeholders[field_name])
+            for literal, field_name in segments
+        )
+
+    return render
 
 class DraftGenerator:
     """
@@ -87,9 +112,19 @@ Product Team"""
         }
     }
 
+    def __init__(self):
+        # Default templates are parsed once instead of on every draft
+        self._compiled_templates = {
+            intent: {
+                "subject": _compile_template(template["subject"]),
+                "body": _compile_template(template["body"]),
+            }
+            for intent, template in self.DEFAULT_TEMPLATES.items()
+        }
+
     def generate_case_number(self) -> str:
         """Generate unique case number."""
-        return f"CASE-{uuid.uuid4().hex[:12].upper()}"
+        return f"CASE-{os.urandom(6).hex().upper()}"
 
     def generate_draft(
         self,
@@ -112,12 +147,6 @@ Product Team"""
         Returns:
             Dictionary with 'subject' and 'content' keys
         """
-        # Use custom template if provided, otherwise use default
-        template = custom_template or self.DEFAULT_TEMPLATES.get(
-            intent,
-            self.DEFAULT_TEMPLATES["support"]  # Fallback to support template
-        )
-
         # Prepare placeholders
         placeholders = {
             "case_number": case_number,
@@ -126,9 +155,17 @@ Product Team"""
             "order_reference": f"order {extracted_info['order_id']}, " if "order_id" in extracted_info else "",
         }
 
-        # Format subject and body
-        subject = template["subject"].format(**placeholders)
-        body = template["body"].format(**placeholders)
+        # Use custom template if provided, otherwise use default
+        if custom_template:
+            subject = custom_template["subject"].format(**placeholders)
+            body = custom_template["body"].format(**placeholders)
+        else:
+            template = self._compiled_templates.get(
+                intent,
+                self._compiled_templates["support"]  # Fallback to support template
+            )
+            subject = template["subject"](placeholders)
+            body = template["body"](placeholders)
 
         return {
             "subject": subject,
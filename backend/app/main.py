@@ -1,7 +1,9 @@
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import codecs
 import time
 
 from . import models, schemas, crud
@@ -13,7 +15,8 @@ models.Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title="Customer Email Auto-Reply Bot API",
     description="API for managing customer emails, auto-classification, and draft generation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for frontend
@@ -39,6 +42,20 @@ async def startup_event():
     """Initialize database on startup."""
     init_db()
 
+def _list_response(schema, rows) -> ORJSONResponse:
+    """
+    Serialize trusted DB rows for list endpoints without re-validating them.
+
+    Returning a Response directly makes FastAPI skip response_model
+    validation, while the declared response_model still documents the
+    endpoint in OpenAPI.
+    """
+    fields = schema.model_fields
+    return ORJSONResponse([
+        schema.model_construct(**{name: getattr(row, name) for name in fields}).model_dump()
+        for row in rows
+    ])
+
 # Email endpoints
 @app.post("/api/emails/", response_model=schemas.EmailResponse, status_code=201)
 def create_email(email: schemas.EmailCreate, db: Session = Depends(get_db)):
@@ -61,12 +78,12 @@ def list_emails(
 ):
     """List all emails with optional folder filter."""
     emails = crud.get_emails(db, skip=skip, limit=limit, folder=folder)
-    return emails
+    return _list_response(schemas.EmailResponse, emails)
 
 @app.get("/api/emails/{email_id}", response_model=schemas.EmailDetailResponse)
 def get_email(email_id: int, db: Session = Depends(get_db)):
     """Get email details including drafts."""
-    db_email = crud.get_email(db, email_id)
+    db_email = crud.get_email_with_drafts(db, email_id)
     if not db_email:
         raise HTTPException(status_code=404, detail="Email not found")
     return db_email
@@ -123,9 +140,9 @@ async def import_emails(file: UploadFile = File(...), db: Session = Depends(get_
         raise HTTPException(status_code=400, detail="File must be a CSV")
 
     try:
-        content = await file.read()
-        csv_content = content.decode('utf-8')
-        result = crud.import_emails_from_csv(db, csv_content)
+        # Decode the upload line by line instead of reading it into memory
+        csv_lines = codecs.iterdecode(file.file, 'utf-8')
+        result = crud.import_emails_from_stream(db, csv_lines)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Import failed: {str(e)}")
@@ -171,7 +188,7 @@ def create_template(template: schemas.TemplateCreate, db: Session = Depends(get_
 def list_templates(db: Session = Depends(get_db)):
     """List all templates."""
     templates = crud.get_templates(db)
-    return templates
+    return _list_response(schemas.TemplateResponse, templates)
 
 @app.get("/api/templates/{template_id}", response_model=schemas.TemplateResponse)
 def get_template(template_id: int, db: Session = Depends(get_db)):
@@ -203,5 +220,12 @@ def health_check():
     return {"status": "healthy", "service": "email-auto-reply-bot"}
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker process gets its own classifier/draft generator and caches
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Index
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql import func
 from .database import Base
 
 class Email(Base):
@@ -8,18 +9,27 @@ class Email(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     case_number = Column(String, unique=True, index=True)
-    sender = Column(String, index=True)
+    sender = Column(String)
     subject = Column(String)
     content = Column(Text)
     intent = Column(String, nullable=True)  # billing, support, bug, feature
     confidence = Column(Float, nullable=True)
-    folder = Column(String, nullable=True)  # corresponds to intent
     needs_review = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), index=True)
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
     drafts = relationship("Draft", back_populates="email", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Serves the folder-filtered, newest-first inbox listing (get_emails)
+        Index("ix_emails_intent_created", "intent", "created_at"),
+    )
+
+    @hybrid_property
+    def folder(self):
+        """Folder the email is filed in; always the same as its intent."""
+        return self.intent
+
 class Template(Base):
     __tablename__ = "templates"
 
@@ -28,18 +38,18 @@ class Template(Base):
     intent_type = Column(String)  # billing, support, bug, feature
     subject_template = Column(String)
     body_template = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
 class Draft(Base):
     __tablename__ = "drafts"
 
     id = Column(Integer, primary_key=True, index=True)
-    email_id = Column(Integer, ForeignKey("emails.id"))
+    email_id = Column(Integer, ForeignKey("emails.id"), index=True)
     subject = Column(String)
     content = Column(Text)
     approved = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
     email = relationship("Email", back_populates="drafts")
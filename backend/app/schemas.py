@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
 from typing import Optional
 from datetime import datetime
 
@@ -18,6 +18,13 @@ class EmailUpdate(BaseModel):
     confidence: Optional[float] = None
     folder: Optional[str] = None
 
+    @model_validator(mode="after")
+    def check_folder_matches_intent(self):
+        # Folder is derived from intent, so the two may only be set together if they agree
+        if self.folder is not None and "intent" in self.model_fields_set and self.intent != self.folder:
+            raise ValueError("folder must match intent when both are set")
+        return self
+
 class EmailResponse(EmailBase):
     id: int
     case_number: str